@@ -0,0 +1,173 @@
+"""Watch a drawbackchess.com session and auto-join the opposite side.
+
+When the monitored page navigates into a game, the monitor opens a second
+browser context for the opposite color and attaches network/WebSocket
+listeners to both so every packet ends up in the log.
+"""
+
+import asyncio
+import re
+import signal
+from datetime import datetime
+
+from playwright.async_api import async_playwright
+
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = lambda obj: orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    import json
+    _loads = json.loads
+    _dumps = lambda obj: json.dumps(obj, indent=2).encode()
+
+GAME_URL_RE = re.compile(r"drawbackchess\.com/game/([a-f0-9-]+)")
+
+LOG_FILE = "monitor_log.txt"
+
+# legal_moves packets fire every half-move and dominate log volume while
+# being the least interesting; keep only every Nth unless the payload size
+# changed materially.
+LM_SAMPLE_EVERY = 10
+LM_SIZE_DELTA = 64
+
+
+class AutoMonitor:
+
+    def __init__(self, log_file=LOG_FILE):
+        self.log_file = log_file
+        # Binary append mode: no TextIOWrapper, so no per-write encode/lock
+        # pair, and payload bytes pass straight through.
+        self._log_fh = open(self.log_file, "ab", buffering=1 << 20)
+        self.browser = None
+        self.seen_games = set()
+        # Last main-frame URL per page, used to coalesce framenavigated
+        # events: sub-frames (iframes, ads) fire the event many times per
+        # real navigation.
+        self._last_url = {}
+        self._lm_count = 0
+        self._lm_last_len = 0
+        self._done = asyncio.Event()
+
+    # --- navigation ---
+
+    def _on_nav(self, page, frame):
+        if frame != page.main_frame:
+            return
+        url = page.url
+        if self._last_url.get(page) == url:
+            return
+        self._last_url[page] = url
+        # Pass the URL along so check_url does not re-read page.url
+        # (a CDP round trip).
+        asyncio.create_task(self.check_url(page, url))
+
+    async def check_url(self, page, url):
+        match = GAME_URL_RE.search(url)
+        if not match:
+            return
+        game_id = match.group(1)
+        if game_id in self.seen_games:
+            return
+        self.seen_games.add(game_id)
+        print(f"New game detected: {game_id}")
+        await self.launch_opposite(game_id)
+
+    async def launch_opposite(self, game_id):
+        new_context = await self.browser.new_context()
+        self.attach_listeners(new_context, "opponent")
+        page = await new_context.new_page()
+        await page.goto(f"https://www.drawbackchess.com/game/{game_id}")
+
+    # --- packet capture ---
+
+    def attach_listeners(self, context, name):
+        # One listener per context instead of per page: request/response
+        # events bubble up from every page (including popups and redirects),
+        # so nothing needs re-attaching later. Only the page-scoped events
+        # (websocket, framenavigated) are hooked as pages appear.
+        context.on("request", lambda r: self.handle_request(r, name))
+        context.on("response",
+                   lambda r: asyncio.create_task(self.handle_response(r, name)))
+        context.on("page", lambda p: self._attach_page(p, name))
+
+    def _attach_page(self, page, name):
+        page.on("websocket", lambda ws: self._attach_ws(ws, name))
+        page.on("framenavigated", lambda frame: self._on_nav(page, frame))
+
+    def _attach_ws(self, ws, name):
+        ws.on("framereceived",
+              lambda payload: self.log_packet(f"{name} <-", payload))
+        ws.on("framesent",
+              lambda payload: self.log_packet(f"{name} ->", payload))
+
+    def handle_request(self, request, name):
+        if "drawbackchess" in request.url and request.method == "POST":
+            self.log_packet(f"{name} -> {request.url}", request.post_data or "")
+
+    async def handle_response(self, response, name):
+        if "drawbackchess" not in response.url:
+            return
+        try:
+            # body() hands us raw bytes; orjson parses bytes directly, so we
+            # skip the text() decode round trip entirely.
+            body = await response.body()
+        except Exception:
+            return
+        self.log_packet(f"{name} <- {response.url}", body)
+
+    def log_packet(self, direction, payload):
+        # Classify on the raw payload before any parsing so the sampled-out
+        # path stays cheap.
+        needle = "legal_moves" if isinstance(payload, str) else b"legal_moves"
+        if needle in payload:
+            self._lm_count += 1
+            size = len(payload)
+            changed = abs(size - self._lm_last_len) > LM_SIZE_DELTA
+            self._lm_last_len = size
+            if not changed and self._lm_count % LM_SAMPLE_EVERY:
+                return
+
+        timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
+        try:
+            pretty = _dumps(_loads(payload))
+        except (ValueError, TypeError):
+            if isinstance(payload, str):
+                pretty = payload.encode("utf-8", "surrogatepass")
+            else:
+                pretty = payload
+        fh = self._log_fh
+        fh.write(b"[%s] %s\n" % (timestamp.encode("ascii"),
+                                 direction.encode("utf-8")))
+        fh.write(pretty)
+        fh.write(b"\n\n")
+
+    # --- entry point ---
+
+    async def run(self):
+        async with async_playwright() as p:
+            self.browser = await p.chromium.launch(headless=False)
+            context = await self.browser.new_context()
+            self.attach_listeners(context, "self")
+            page = await context.new_page()
+            await page.goto("https://www.drawbackchess.com")
+            print("Monitoring. Ctrl-C to quit.")
+            # Sleep until told to stop instead of waking the loop every
+            # second; Ctrl-C sets the event where signal handlers are
+            # supported, with KeyboardInterrupt as the Windows fallback.
+            loop = asyncio.get_running_loop()
+            try:
+                loop.add_signal_handler(signal.SIGINT, self._done.set)
+            except NotImplementedError:
+                pass
+            try:
+                await self._done.wait()
+            finally:
+                self._log_fh.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(AutoMonitor().run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,36 @@
+"""Quick sanity check of what the watcher has written to the database."""
+
+from sqlalchemy import func, select
+
+from data_handler import DatabaseManager
+from models import Game, Position
+
+
+def check_stats():
+    db = DatabaseManager()
+    with db.get_session() as session:
+        # Both counts in one round trip, without the subquery wrapper that
+        # Query.count() emits.
+        games_count, positions_count = session.execute(select(
+            select(func.count(Game.id)).scalar_subquery(),
+            select(func.count(Position.id)).scalar_subquery(),
+        )).one()
+        print(f"Games:     {games_count}")
+        print(f"Positions: {positions_count}")
+
+        # Narrow tuple projection: no ORM instances, and the legal-move count
+        # comes from the materialized column instead of decoding the JSON blob
+        # per row.
+        positions = (session.query(Position.game_id, Position.move_number,
+                                   Position.move_uci, Position.legal_move_count)
+                     .order_by(Position.created_at.desc())
+                     .limit(5)
+                     .all())
+        print("\nMost recent positions:")
+        for game_id, move_number, move_uci, legal_move_count in positions:
+            print(f"  game {game_id} ply {move_number}: "
+                  f"{move_uci or '-'} ({legal_move_count or 0} legal moves)")
+
+
+if __name__ == "__main__":
+    check_stats()
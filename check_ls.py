@@ -0,0 +1,31 @@
+"""Dump drawbackchess.com localStorage, for poking at session/auth keys."""
+
+import asyncio
+import json
+
+from playwright.async_api import async_playwright
+
+
+async def main():
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(
+            args=["--disable-extensions", "--disable-gpu", "--no-sandbox"])
+        page = await browser.new_page()
+        await page.goto("https://www.drawbackchess.com",
+                        wait_until="domcontentloaded")
+        # Wait for the exact condition we need instead of a flat sleep:
+        # returns as soon as localStorage is populated (often <200 ms),
+        # still bounded at 2 s.
+        try:
+            await page.wait_for_function(
+                "() => Object.keys(localStorage).length > 0", timeout=2000)
+        except Exception:
+            pass  # empty localStorage is a valid answer
+
+        storage = await page.evaluate("() => Object.assign({}, localStorage)")
+        print(json.dumps(storage, indent=2))
+        await browser.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,424 @@
+"""Persistence layer: takes parsed packets and stores them via SQLAlchemy."""
+
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import orjson
+
+from sqlalchemy import create_engine, event, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import sessionmaker
+
+from drawback_manager import DrawbackManager
+from models import (Base, Game, Move, Pattern, Position, SensorReading,
+                    TrainingSample)
+from packet_parser import PacketParser, pack_moves
+
+DB_PATH = "drawback_games.db"
+
+# Trigger-maintained statistics side tables. Keeping the aggregates
+# up to date on write turns get_game_statistics into point lookups
+# instead of full scans of games and sensor_readings on every call.
+_STATS_DDL = (
+    """CREATE TABLE IF NOT EXISTS game_stats_summary (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        game_count INTEGER NOT NULL DEFAULT 0,
+        total_moves_sum INTEGER NOT NULL DEFAULT 0,
+        games_with_drawbacks INTEGER NOT NULL DEFAULT 0)""",
+    """CREATE TABLE IF NOT EXISTS drawback_type_counts (
+        drawback_type TEXT PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0)""",
+    # Backfill once from whatever the tables already hold; no-ops when
+    # the summary row exists.
+    """INSERT OR IGNORE INTO game_stats_summary
+        (id, game_count, total_moves_sum, games_with_drawbacks)
+        SELECT 1, COUNT(*), COALESCE(SUM(total_moves), 0),
+            (SELECT COUNT(*) FROM games g
+             WHERE EXISTS (SELECT 1 FROM sensor_readings s
+                           WHERE s.game_id = g.id
+                             AND s.drawback_detected = 1))
+        FROM games""",
+    """INSERT OR IGNORE INTO drawback_type_counts (drawback_type, count)
+        SELECT drawback_type, COUNT(*) FROM sensor_readings
+        WHERE drawback_detected = 1 AND drawback_type IS NOT NULL
+        GROUP BY drawback_type""",
+    """CREATE TRIGGER IF NOT EXISTS trg_stats_game_insert
+        AFTER INSERT ON games BEGIN
+            UPDATE game_stats_summary SET
+                game_count = game_count + 1,
+                total_moves_sum = total_moves_sum
+                    + COALESCE(NEW.total_moves, 0);
+        END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_stats_game_moves
+        AFTER UPDATE OF total_moves ON games BEGIN
+            UPDATE game_stats_summary SET
+                total_moves_sum = total_moves_sum
+                    + COALESCE(NEW.total_moves, 0)
+                    - COALESCE(OLD.total_moves, 0);
+        END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_stats_sensor_insert
+        AFTER INSERT ON sensor_readings
+        WHEN NEW.drawback_detected = 1 BEGIN
+            UPDATE game_stats_summary SET
+                games_with_drawbacks = games_with_drawbacks
+                    + (NOT EXISTS (SELECT 1 FROM sensor_readings s
+                                   WHERE s.game_id = NEW.game_id
+                                     AND s.drawback_detected = 1
+                                     AND s.id != NEW.id));
+            INSERT INTO drawback_type_counts (drawback_type, count)
+                VALUES (COALESCE(NEW.drawback_type, ''), 1)
+                ON CONFLICT (drawback_type)
+                DO UPDATE SET count = count + 1;
+        END""",
+)
+
+
+class DatabaseManager:
+    """Owns the engine/session factory for the game database."""
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._initialize_database()
+
+    def _initialize_database(self):
+        # One pooled connection, SQLAlchemy-managed transactions. The old
+        # StaticPool + autocommit isolation combination serialized every
+        # caller through a single autocommitting connection — one fsync per
+        # statement and no transaction batching at all.
+        self.engine = create_engine(
+            f"sqlite:///{self.db_path}",
+            pool_size=1,
+            max_overflow=0,
+            connect_args={"check_same_thread": False},
+        )
+
+        @event.listens_for(self.engine, "connect")
+        def set_sqlite_pragma(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            # Let the WAL grow before checkpointing and map the database
+            # read-side; both keep checkpoint stalls off the ingest path.
+            cursor.execute("PRAGMA wal_autocheckpoint=10000")
+            cursor.execute("PRAGMA mmap_size=268435456")
+            cursor.close()
+
+        @event.listens_for(self.engine, "close")
+        def run_pragma_optimize(dbapi_connection, connection_record):
+            # Refreshes sqlite_stat1 cheaply when the connection retires;
+            # stale planner stats turn the sensor predicates into scans.
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA optimize")
+            cursor.close()
+
+        Base.metadata.create_all(self.engine)
+        # create_all does not retrofit constraints onto tables that already
+        # exist; make sure older databases get the indexes too.
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_pos_game_ply "
+                "ON positions(game_id, move_number)"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_pos_game_side_ply "
+                "ON positions(game_id, active_side, move_number DESC)"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_sensor_drawback "
+                "ON sensor_readings(drawback_detected, drawback_type, "
+                "drawback_severity)"))
+            for ddl in _STATS_DDL:
+                conn.execute(text(ddl))
+        self.Session = sessionmaker(bind=self.engine)
+        # Long-lived write session for group commit: many appended rows
+        # share one fsync instead of one per packet.
+        self._write_session = None
+        self._group_rows = 0
+        self._group_start = time.monotonic()
+        # Precompiled Core statement for the append-only fact table; the
+        # ORM unit of work buys nothing on that path.
+        self._pos_insert = sqlite_insert(Position).on_conflict_do_nothing(
+            index_elements=["game_id", "move_number"])
+        self._stores_since_analyze = 0
+
+    # Games stored between ANALYZE refreshes of the planner stats.
+    ANALYZE_EVERY = 256
+
+    def note_game_stored(self):
+        """Called after a bulk game store; re-ANALYZE periodically.
+
+        sqlite_stat1 goes stale as the tables grow, and without it the
+        planner misjudges the sensor predicates. Must be called outside
+        any open session — ANALYZE takes its own transaction.
+        """
+        self._stores_since_analyze += 1
+        if self._stores_since_analyze >= self.ANALYZE_EVERY:
+            self._stores_since_analyze = 0
+            self._release_write_session()
+            with self.engine.begin() as conn:
+                conn.execute(text("ANALYZE sensor_readings"))
+                conn.execute(text("ANALYZE games"))
+                conn.execute(text("ANALYZE positions"))
+
+    def _release_write_session(self):
+        """Commit the write session so it gives back its connection.
+
+        With one pooled connection and no overflow, a write session left
+        idle-in-transaction by a skipped group commit holds the pool's
+        only connection, and whichever caller next needs a second one
+        blocks until the checkout times out. Any path that checks out a
+        connection of its own calls this first; committing a quiescent
+        session is a no-op.
+        """
+        if self._write_session is not None:
+            self._write_session.commit()
+            self._group_rows = 0
+            self._group_start = time.monotonic()
+
+    def bulk_insert_positions(self, rows):
+        """One executemany, one transaction, no ORM bookkeeping."""
+        self._release_write_session()
+        with self.engine.begin() as conn:
+            conn.execute(self._pos_insert, rows)
+
+    @contextmanager
+    def get_session(self):
+        self._release_write_session()
+        session = self.Session()
+        try:
+            # Take the write lock up front; avoids "database is locked"
+            # races between the watcher and the check scripts.
+            session.execute(text("BEGIN IMMEDIATE"))
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def get_write_session(self):
+        """The shared long-lived session used by the streaming ingest path."""
+        if self._write_session is None:
+            self._write_session = self.Session()
+        return self._write_session
+
+    def commit_group(self, rows=1, min_rows=64, max_age_ms=50):
+        """Commit the write session once enough rows or time accumulated."""
+        self._group_rows += rows
+        now = time.monotonic()
+        if (self._group_rows >= min_rows
+                or (now - self._group_start) * 1000 >= max_age_ms):
+            self._write_session.commit()
+            self._group_rows = 0
+            self._group_start = now
+
+    def finalize(self):
+        """Flush and close the write session; call on shutdown."""
+        if self._write_session is not None:
+            self._write_session.commit()
+            self._write_session.close()
+            self._write_session = None
+
+    # --- small write helpers used by scripts and the handler below ---
+
+    def create_game(self, session, **kwargs):
+        game = Game(**kwargs)
+        session.add(game)
+        session.flush()
+        return game
+
+    def create_position(self, session, **kwargs):
+        position = Position(**kwargs)
+        session.add(position)
+        session.flush()
+        return position
+
+    def create_move(self, session, **kwargs):
+        move = Move(**kwargs)
+        session.add(move)
+        session.flush()
+        return move
+
+    def add_sensor_reading(self, session, **kwargs):
+        reading = SensorReading(**kwargs)
+        session.add(reading)
+        session.flush()
+        return reading
+
+    def create_training_sample(self, session, **kwargs):
+        sample = TrainingSample(**kwargs)
+        session.add(sample)
+        session.flush()
+        return sample
+
+    def create_or_update_pattern(self, session, pattern_type, pattern_key):
+        pattern = session.query(Pattern).filter_by(pattern_key=pattern_key).first()
+        if pattern:
+            pattern.occurrences += 1
+        else:
+            pattern = Pattern(pattern_type=pattern_type, pattern_key=pattern_key)
+            session.add(pattern)
+        session.flush()
+        return pattern
+
+
+class DataHandler:
+    """Routes decoded packets from the watcher into the database."""
+
+    def __init__(self, db=None):
+        self.db = db or DatabaseManager()
+        self.drawback_manager = DrawbackManager()
+        self.active_games = {}
+        # Positions are buffered and flushed in one executemany per batch;
+        # a session + INSERT per packet made every game_state round-trip
+        # bound. Staged as plain tuples (column order below) — the mapping
+        # dicts are only built once per flush.
+        self._pos_cols = ("game_id", "move_number", "fen", "active_side",
+                          "move_uci", "legal_moves_blob", "legal_move_count")
+        self._pending_positions = []
+        self._last_flush = time.monotonic()
+        # Highest ply seen per game uuid, maintained as packets arrive so
+        # game-over needs no COUNT(*) round trip.
+        self._ply_counts = defaultdict(int)
+        # register_drawback is idempotent (and hits the stats file); skip
+        # the two calls repeated on every single packet.
+        self._seen_drawbacks = set()
+
+    def handle_packet(self, data):
+        packet_type = data.get("type")
+        if packet_type == "game_state":
+            self._handle_game_state(data)
+        elif packet_type == "local_move":
+            self._handle_local_move(data)
+        elif packet_type == "game_over":
+            self._handle_game_over(data)
+
+    def _resolve_game_id(self, session, game_id, data=None):
+        """uuid -> games.id, hitting the DB only on first sight of a game."""
+        game_record_id = self.active_games.get(game_id)
+        if game_record_id is not None:
+            return game_record_id
+        game_record = session.query(Game).filter_by(uuid=game_id).first()
+        if not game_record:
+            if data is None:
+                return None
+            game_record = self.db.create_game(
+                session,
+                uuid=game_id,
+                white_drawback=data.get("white_drawback"),
+                black_drawback=data.get("black_drawback"),
+            )
+        self.active_games[game_id] = game_record.id
+        return game_record.id
+
+    def _handle_game_state(self, data):
+        game_id = data["game_id"]
+        game_record_id = self.active_games.get(game_id)
+        if game_record_id is None:
+            with self.db.get_session() as session:
+                game_record_id = self._resolve_game_id(session, game_id, data)
+
+        for key in (data.get("white_drawback"), data.get("black_drawback")):
+            if key and key not in self._seen_drawbacks:
+                self.drawback_manager.register_drawback(
+                    key.split(":", 1)[0], key)
+                self._seen_drawbacks.add(key)
+
+        fen = PacketParser.board_to_fen(data["board"], data["turn"])
+        legal_moves = PacketParser.extract_legal_moves(data)
+        ply = data.get("ply", 0)
+
+        self._pending_positions.append((
+            game_record_id,
+            ply,
+            fen,
+            data["turn"],
+            data.get("last_move"),
+            pack_moves(legal_moves),
+            len(legal_moves),
+        ))
+        self._ply_counts[game_id] = max(self._ply_counts[game_id], ply + 1)
+        self.flush()
+
+    FLUSH_ROWS = 64
+    FLUSH_AGE = 0.1  # seconds
+
+    def flush(self, force=False):
+        """Write buffered positions in one INSERT OR IGNORE executemany.
+
+        The conflict clause replaces the old per-row SELECT existence
+        check; duplicate (game_id, move_number) rows are simply dropped.
+        """
+        if not self._pending_positions:
+            return
+        if (not force and len(self._pending_positions) < self.FLUSH_ROWS
+                and time.monotonic() - self._last_flush < self.FLUSH_AGE):
+            return
+        staged = self._pending_positions
+        self._pending_positions = []
+        self._last_flush = time.monotonic()
+        cols = self._pos_cols
+        self.db.bulk_insert_positions([dict(zip(cols, row)) for row in staged])
+
+    def finalize(self):
+        """Drain buffers and commit; wired to the watcher's shutdown path."""
+        self.flush(force=True)
+        self.db.finalize()
+
+    def _handle_local_move(self, data):
+        game_id = data["game_id"]
+        # The latest-position query below must see the rows still
+        # sitting in the position buffer, or the move gets numbered
+        # from a stale ply. Moves are rare next to game_state, so the
+        # forced flush costs little.
+        self.flush(force=True)
+        session = self.db.get_write_session()
+        game_record_id = self._resolve_game_id(session, game_id)
+        if game_record_id is None:
+            return
+        last_pos = (session.query(Position)
+                    .filter_by(game_id=game_record_id,
+                               active_side=data.get("side"))
+                    .order_by(Position.move_number.desc())
+                    .first())
+        move_number = (last_pos.move_number + 1) if last_pos else 0
+        self.db.create_move(
+            session,
+            game_id=game_record_id,
+            move_number=move_number,
+            uci=data["uci"],
+            side=data.get("side"),
+        )
+        self.db.commit_group()
+
+    def _handle_game_over(self, data):
+        game_id = data["game_id"]
+        self.flush(force=True)
+        self.active_games.pop(game_id, None)
+        with self.db.get_session() as session:
+            session.execute(
+                update(Game)
+                .where(Game.uuid == game_id)
+                .values(result=data.get("result"),
+                        total_moves=self._ply_counts.pop(game_id, 0)))
+
+    def export_training_data(self, output_path="training_data.jsonl"):
+        """Stream every training sample to a JSONL file, one line each.
+
+        yield_per keeps memory flat no matter how large the table gets;
+        the old list-then-json.dump path materialized the dataset twice.
+        """
+        count = 0
+        with self.db.get_session() as session, open(output_path, "wb") as fh:
+            for sample in session.query(TrainingSample).yield_per(1000):
+                fh.write(orjson.dumps({
+                    "fen": sample.fen,
+                    "drawback": sample.drawback,
+                    "legal_moves": orjson.loads(
+                        sample.legal_moves_json or "[]"),
+                    "illegal_moves": orjson.loads(
+                        sample.illegal_moves_json or "[]"),
+                }))
+                fh.write(b"\n")
+                count += 1
+        return count
@@ -0,0 +1,123 @@
+"""Track every drawback we have seen and how well the engine copes with it."""
+
+import atexit
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import orjson
+
+try:
+    import ijson
+except ImportError:  # optional; only needed for very large catalogs
+    ijson = None
+
+STATS_FILE = "drawback_stats.json"
+
+# Catalogs past this size are stream-parsed instead of loaded whole.
+LARGE_STATS_BYTES = 1_000_000
+
+# Minimum seconds between catalog rewrites; mutations in between only
+# mark the catalog dirty.
+SAVE_INTERVAL = 5.0
+
+
+class DrawbackManager:
+    """In-memory drawback catalog persisted to drawback_stats.json."""
+
+    def __init__(self, stats_file=STATS_FILE):
+        self.stats_file = Path(stats_file)
+        self.stats = {}
+        # Rewriting the whole catalog on every mutation is O(N) IO per
+        # update — O(N²) over a session. Mutations set a dirty flag and
+        # the file is rewritten at most every SAVE_INTERVAL seconds, plus
+        # once at exit.
+        self._dirty = False
+        self._last_save = 0.0
+        self.load_stats()
+        atexit.register(self.save_stats)
+
+    def load_stats(self):
+        if not self.stats_file.exists():
+            return
+        if (ijson is not None
+                and self.stats_file.stat().st_size > LARGE_STATS_BYTES):
+            # Stream entry by entry: peak memory is one entry, not the
+            # whole file plus its parse tree.
+            with open(self.stats_file, "rb") as fh:
+                self.stats = dict(ijson.kvitems(fh, "", use_float=True))
+        else:
+            self.stats = orjson.loads(self.stats_file.read_bytes())
+
+    def save_stats(self):
+        if not self._dirty:
+            return
+        # Atomic replace: a crash mid-write leaves the old file intact,
+        # which lets us skip the fsync-per-save the old path relied on.
+        tmp = self.stats_file.with_suffix(".tmp")
+        tmp.write_bytes(orjson.dumps(self.stats, option=orjson.OPT_INDENT_2))
+        os.replace(tmp, self.stats_file)
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+    def _mark_dirty(self):
+        self._dirty = True
+        if time.monotonic() - self._last_save > SAVE_INTERVAL:
+            self.save_stats()
+
+    def register_drawback(self, drawback_type, name):
+        """Record that a drawback exists; idempotent."""
+        entry = self.stats.get(name)
+        if entry is None:
+            entry = {
+                "type": drawback_type,
+                "games": 0,
+                "wins": 0,
+                "accuracy": 0.0,
+                "last_seen": time.time(),
+            }
+            self.stats[name] = entry
+        else:
+            entry["last_seen"] = time.time()
+        self._mark_dirty()
+
+    def record_result(self, name, won, accuracy=None):
+        """Update per-drawback results after a game finishes."""
+        entry = self.stats.setdefault(name, {
+            "type": "unknown",
+            "games": 0,
+            "wins": 0,
+            "accuracy": 0.0,
+            "last_seen": time.time(),
+        })
+        entry["games"] += 1
+        if won:
+            entry["wins"] += 1
+        if accuracy is not None:
+            games = entry["games"]
+            entry["accuracy"] = ((entry["accuracy"] * (games - 1)) + accuracy) / games
+        entry["last_seen"] = time.time()
+        self._mark_dirty()
+
+    def get_worst_performing(self, n=10):
+        """Return the n drawbacks with the lowest prediction accuracy.
+
+        argpartition picks the k worst in O(N) over a columnar float
+        array rather than sorting dicts with Python comparisons; only
+        the selected rows are materialized.
+        """
+        if not self.stats:
+            return []
+        names = list(self.stats)
+        accuracy = np.fromiter(
+            (entry.get("accuracy", 0.0) for entry in self.stats.values()),
+            dtype=np.float32, count=len(names))
+        k = min(n, len(names))
+        idx = np.argpartition(accuracy, k - 1)[:k]
+        idx = idx[np.argsort(accuracy[idx], kind="stable")]
+        return [
+            {"name": names[i], "accuracy": float(accuracy[i]),
+             "games": self.stats[names[i]].get("games", 0)}
+            for i in idx
+        ]
@@ -0,0 +1,406 @@
+"""Archival game storage: whole-game records for training and export.
+
+DataHandler ingests live packets row by row; GameStorage is the layer
+above it that reads and writes complete games as plain records for the
+training pipeline and PGN export.
+"""
+
+import random
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from sqlalchemy import and_, exists, func, insert, text
+from sqlalchemy.orm import selectinload
+
+from data_handler import DatabaseManager
+from models import (Game, LegalMove, Move, Position, SensorReading,
+                    compress_json, decompress_json)
+
+# Core statement built once for the write-only legal-move rows; the ORM
+# unit of work buys nothing there, same as the position ingest path in
+# data_handler.
+_LEGAL_MOVE_INSERT = insert(LegalMove)
+
+# Result string -> PGN result token; dict lookup instead of a branch
+# chain on the bulk-export path.
+_RESULT_MAP = {"white_win": "1-0", "black_win": "0-1", "draw": "1/2-1/2"}
+
+
+def _pgn_tokens(moves):
+    """Yield PGN movetext tokens; feeds str.join without a list."""
+    for i, move in enumerate(moves):
+        san = move.move_san or move.move_uci
+        yield f"{i // 2 + 1}.{san}" if i % 2 == 0 else san
+
+
+@dataclass
+class LegalMoveRecord:
+    move_uci: str
+    is_capture: bool = False
+    gives_check: bool = False
+
+
+class SensorRecord:
+    """One sensor reading; payload dicts decode on first access.
+
+    retrieve_game hands over the stored blobs untouched, so consumers
+    that never look at the payloads (PGN export, move-list training)
+    never pay the gunzip + JSON parse per reading.
+    """
+
+    __slots__ = ("reading_type", "drawback_detected", "drawback_type",
+                 "drawback_severity", "_raw_data", "_processed_data",
+                 "_raw_blob", "_processed_blob")
+
+    def __init__(self, reading_type=None, raw_data=None, processed_data=None,
+                 drawback_detected=False, drawback_type=None,
+                 drawback_severity=0.0, raw_blob=None, processed_blob=None):
+        self.reading_type = reading_type
+        self.drawback_detected = drawback_detected
+        self.drawback_type = drawback_type
+        self.drawback_severity = drawback_severity
+        self._raw_data = raw_data
+        self._processed_data = processed_data
+        self._raw_blob = raw_blob
+        self._processed_blob = processed_blob
+
+    @property
+    def raw_data(self):
+        if self._raw_data is None:
+            self._raw_data = decompress_json(self._raw_blob)
+            self._raw_blob = None
+        return self._raw_data
+
+    @property
+    def processed_data(self):
+        if self._processed_data is None:
+            self._processed_data = decompress_json(self._processed_blob)
+            self._processed_blob = None
+        return self._processed_data
+
+
+@dataclass
+class PositionRecord:
+    move_number: int
+    fen: str
+    active_side: str = None
+    move_uci: str = None
+    legal_moves: list = field(default_factory=list)
+
+
+@dataclass
+class MoveRecord:
+    move_number: int
+    move_uci: str
+    move_san: str = None
+    side: str = None
+
+
+@dataclass
+class GameRecord:
+    uuid: str
+    white_drawback: str = None
+    black_drawback: str = None
+    result: str = None
+    total_moves: int = 0
+    started_at: datetime = None
+    positions: list = field(default_factory=list)
+    moves: list = field(default_factory=list)
+    sensor_readings: list = field(default_factory=list)
+
+
+class GameStorage:
+    """Store and retrieve complete games as records."""
+
+    # retrieve_game memo: epoch re-shuffles and PGN re-exports request
+    # the same ids repeatedly. Retrievals cheaper than the threshold are
+    # not cached, so tiny games cannot evict ones worth keeping.
+    CACHE_MAX = 256
+    CACHE_MIN_SECONDS = 0.005
+
+    # Column order for the staged legal-move tuples in store_game; the
+    # mapping dicts are only built at the executemany boundary, the same
+    # staging pattern DataHandler uses for positions.
+    _LM_COLS = ("position_id", "move_uci", "is_capture", "gives_check")
+
+    def __init__(self, db=None):
+        self.db = db or DatabaseManager()
+        self._game_cache = OrderedDict()
+
+    def store_game(self, game_record, session=None):
+        """Persist a GameRecord and return the database game id.
+
+        Child rows go in as four executemany batches inside one
+        transaction — one commit and one fsync per game instead of an
+        INSERT+flush per row (a game with 80 positions x ~30 legal moves
+        used to pay ~2400 of those). Pass ``session`` to reuse a caller's
+        session; otherwise one is opened for the call.
+        """
+        if session is None:
+            with self.db.get_session() as session:
+                game_id = self.store_game(game_record, session)
+            # After the commit: ANALYZE takes its own transaction.
+            self.db.note_game_stored()
+            return game_id
+        game = self.db.create_game(
+            session,
+            uuid=game_record.uuid,
+            white_drawback=game_record.white_drawback,
+            black_drawback=game_record.black_drawback,
+            result=game_record.result,
+            total_moves=game_record.total_moves,
+        )
+        positions_rows = [
+            dict(game_id=game.id,
+                 move_number=pos_record.move_number,
+                 fen=pos_record.fen,
+                 active_side=pos_record.active_side,
+                 move_uci=pos_record.move_uci)
+            for pos_record in game_record.positions
+        ]
+        # return_defaults fills in the generated ids the legal-move
+        # rows need as foreign keys.
+        session.bulk_insert_mappings(Position, positions_rows,
+                                     return_defaults=True)
+        lm_cols = self._LM_COLS
+        legal_moves_rows = [
+            (row["id"], lm.move_uci, lm.is_capture, lm.gives_check)
+            for row, pos_record in zip(positions_rows,
+                                       game_record.positions)
+            for lm in pos_record.legal_moves
+        ]
+        if legal_moves_rows:
+            session.execute(
+                _LEGAL_MOVE_INSERT,
+                [dict(zip(lm_cols, t)) for t in legal_moves_rows])
+        moves_rows = [
+            dict(game_id=game.id,
+                 move_number=move_record.move_number,
+                 uci=move_record.move_uci,
+                 san=move_record.move_san,
+                 side=move_record.side)
+            for move_record in game_record.moves
+        ]
+        if moves_rows:
+            session.bulk_insert_mappings(Move, moves_rows)
+        sensor_rows = [
+            dict(game_id=game.id,
+                 reading_type=sensor.reading_type,
+                 raw_data=compress_json(sensor.raw_data),
+                 processed_data=compress_json(sensor.processed_data),
+                 drawback_detected=sensor.drawback_detected,
+                 drawback_type=sensor.drawback_type,
+                 drawback_severity=sensor.drawback_severity)
+            for sensor in game_record.sensor_readings
+        ]
+        if sensor_rows:
+            session.bulk_insert_mappings(SensorReading, sensor_rows)
+        self._game_cache.clear()
+        return game.id
+
+    def retrieve_game(self, game_id, session=None):
+        """Load a full game as a GameRecord, or None if absent.
+
+        Hits the bounded LRU memo first; see _retrieve_game_impl for the
+        query itself. Pass ``session`` to reuse a caller's session.
+        """
+        record = self._game_cache.get(game_id)
+        if record is not None:
+            self._game_cache.move_to_end(game_id)
+            return record
+        start = time.perf_counter()
+        record = self._retrieve_game_impl(game_id, session)
+        if (record is not None
+                and time.perf_counter() - start >= self.CACHE_MIN_SECONDS):
+            self._game_cache[game_id] = record
+            if len(self._game_cache) > self.CACHE_MAX:
+                self._game_cache.popitem(last=False)
+        return record
+
+    def _retrieve_game_impl(self, game_id, session=None):
+        """The uncached load.
+
+        selectinload batches every child collection into one IN query, so
+        a whole game costs four statements regardless of length, instead
+        of one LegalMove query per position (the classic N+1 pattern).
+        """
+        if session is None:
+            with self.db.get_session() as session:
+                return self._retrieve_game_impl(game_id, session)
+        game = (session.query(Game)
+                .options(selectinload(Game.positions)
+                         .selectinload(Position.legal_moves),
+                         selectinload(Game.moves),
+                         selectinload(Game.sensor_readings))
+                .get(game_id))
+        if game is None:
+            return None
+        return self._game_to_record(game)
+
+    @staticmethod
+    def _game_to_record(game):
+        """Convert a (fully loaded) ORM Game into a GameRecord."""
+        positions = [
+            PositionRecord(
+                move_number=pos.move_number,
+                fen=pos.fen,
+                active_side=pos.active_side,
+                move_uci=pos.move_uci,
+                legal_moves=[
+                    LegalMoveRecord(move_uci=lm.move_uci,
+                                    is_capture=lm.is_capture,
+                                    gives_check=lm.gives_check)
+                    for lm in pos.legal_moves
+                ],
+            )
+            for pos in sorted(game.positions, key=lambda p: p.move_number)
+        ]
+        moves = [
+            MoveRecord(move_number=m.move_number, move_uci=m.uci,
+                       move_san=m.san, side=m.side)
+            for m in sorted(game.moves, key=lambda m: m.move_number)
+        ]
+        sensor_readings = [
+            SensorRecord(
+                reading_type=r.reading_type,
+                raw_blob=r.raw_data,
+                processed_blob=r.processed_data,
+                drawback_detected=r.drawback_detected,
+                drawback_type=r.drawback_type,
+                drawback_severity=r.drawback_severity,
+            )
+            for r in game.sensor_readings
+        ]
+        return GameRecord(
+            uuid=game.uuid,
+            white_drawback=game.white_drawback,
+            black_drawback=game.black_drawback,
+            result=game.result,
+            total_moves=game.total_moves,
+            started_at=game.created_at,
+            positions=positions,
+            moves=moves,
+            sensor_readings=sensor_readings,
+        )
+
+    def get_training_positions(self, limit=1000):
+        """Stream a random sample of games as records for training.
+
+        A generator over eager-loaded queries: games are converted and
+        yielded in batches rather than calling retrieve_game per id, so
+        memory stays flat in the game count and no game pays a fresh
+        session + query burst.
+
+        Sampling draws random ids in [1, max_id] and fetches them by
+        primary key. ORDER BY random() made SQLite scan the whole table
+        and sort every row through a temp B-tree; this is O(limit) point
+        lookups on the rowid B-tree instead. Id gaps from deleted games
+        are covered by over-sampling and retrying.
+        """
+        with self.db.get_session() as session:
+            max_id = session.query(func.max(Game.id)).scalar()
+            if not max_id:
+                return
+            options = (selectinload(Game.positions)
+                       .selectinload(Position.legal_moves),
+                       selectinload(Game.moves),
+                       selectinload(Game.sensor_readings))
+            tried = set()
+            yielded = 0
+            while yielded < limit and len(tried) < max_id:
+                want = limit - yielded
+                batch = {random.randint(1, max_id) for _ in range(want * 2)}
+                batch -= tried
+                if not batch:
+                    continue
+                tried |= batch
+                query = (session.query(Game)
+                         .options(*options)
+                         .filter(Game.id.in_(batch))
+                         .yield_per(64))
+                for game in query:
+                    yield self._game_to_record(game)
+                    yielded += 1
+                    if yielded == limit:
+                        return
+
+    def find_games_with_drawbacks(self, min_severity=0.5,
+                                  drawback_type=None, limit=100):
+        """Games whose sensor readings flagged a drawback.
+
+        An EXISTS semi-join: the plain join produced one row per
+        matching reading, so a game with many readings came back (and
+        was retrieved) many times over. EXISTS short-circuits on the
+        first match per game via ix_sensor_drawback, one result row per
+        game. Predicates mirror the index order: equality columns first,
+        the severity range last.
+        """
+        with self.db.get_session() as session:
+            conditions = [SensorReading.game_id == Game.id,
+                          SensorReading.drawback_detected == True]
+            if drawback_type:
+                conditions.append(
+                    SensorReading.drawback_type == drawback_type)
+            conditions.append(
+                SensorReading.drawback_severity >= min_severity)
+            query = (session.query(Game)
+                     .filter(exists().where(and_(*conditions))))
+            # One session serves the id query and every retrieval.
+            return [self.retrieve_game(g.id, session)
+                    for g in query.limit(limit).all()]
+
+    def find_games_by_result(self, result, limit=100):
+        """Full records of games that ended with the given result."""
+        with self.db.get_session() as session:
+            return [self.retrieve_game(g.id, session)
+                    for g in (session.query(Game)
+                              .filter(Game.result == result)
+                              .limit(limit)
+                              .all())]
+
+    def get_game_statistics(self):
+        """Aggregate stats across the whole database.
+
+        Reads the trigger-maintained side tables (_STATS_DDL in
+        data_handler): point lookups instead of full scans of games and
+        sensor_readings on every call.
+        """
+        with self.db.get_session() as session:
+            row = session.execute(text(
+                "SELECT game_count, total_moves_sum, games_with_drawbacks "
+                "FROM game_stats_summary WHERE id = 1")).one_or_none()
+            game_count, moves_sum, games_with_drawbacks = row or (0, 0, 0)
+            drawback_type_counts = dict(session.execute(text(
+                "SELECT drawback_type, count "
+                "FROM drawback_type_counts")).all())
+        return {
+            "total_games": game_count,
+            "avg_game_length": (moves_sum / game_count
+                                if game_count else 0.0),
+            "games_with_drawbacks": games_with_drawbacks,
+            "drawback_type_counts": drawback_type_counts,
+        }
+
+    def export_game_pgn(self, game_id):
+        """Render a stored game as a PGN string, or None if absent."""
+        game_record = self.retrieve_game(game_id)
+        if game_record is None:
+            return None
+        date = game_record.started_at or datetime.now()
+        headers = [
+            '[Event "Drawback Chess"]',
+            '[Site "drawbackchess.com"]',
+            # f-string over strftime: no format-string parse per game.
+            f'[Date "{date.year}.{date.month:02d}.{date.day:02d}"]',
+            f'[WhiteDrawback "{game_record.white_drawback or "?"}"]',
+            f'[BlackDrawback "{game_record.black_drawback or "?"}"]',
+            f'[Result "{self._result_to_pgn(game_record.result)}"]',
+        ]
+        movetext = " ".join(_pgn_tokens(game_record.moves))
+        return ("\n".join(headers) + "\n\n" + movetext
+                + " " + self._result_to_pgn(game_record.result) + "\n")
+
+    def _result_to_pgn(self, result):
+        return _RESULT_MAP.get(result, "*")
@@ -0,0 +1,103 @@
+"""Generate sentence embeddings for the drawback catalog.
+
+Reads the drawback descriptions from a JSON catalog, encodes them with a
+MiniLM sentence transformer and writes:
+
+  * ``<output>.npy``  -- the embedding matrix, float16, C-contiguous.
+    Consumers should open it with ``np.load(path, mmap_mode="r")`` so every
+    process (auto_monitor, the engine workers started by
+    run_dual_instances.py, ...) shares a single page-cached copy instead of
+    each reading the whole matrix at startup.
+  * ``<output>.idx``  -- a small binary index: ``struct.pack("<I", N)``
+    followed by N null-terminated UTF-8 drawback names, in row order.
+    Readers can recover row -> name without parsing the mapping JSON.
+  * ``<output>_mapping.json`` -- name -> row mapping, kept for tooling that
+    prefers JSON.
+"""
+
+import json
+import struct
+from pathlib import Path
+
+import numpy as np
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+
+def write_index(idx_path, names):
+    """Write the binary row index: little-endian count + NUL-terminated names."""
+    with open(idx_path, "wb") as fh:
+        fh.write(struct.pack("<I", len(names)))
+        for name in names:
+            fh.write(name.encode("utf-8"))
+            fh.write(b"\x00")
+
+
+def read_index(idx_path):
+    """Read the binary row index back into a list of names."""
+    data = Path(idx_path).read_bytes()
+    (count,) = struct.unpack_from("<I", data, 0)
+    names = data[4:].split(b"\x00")[:count]
+    return [n.decode("utf-8") for n in names]
+
+
+def generate_drawback_embeddings(json_file="drawbacks.json",
+                                 output_file="drawback_embeddings.npy"):
+    """Encode every drawback description and save the matrix + indexes.
+
+    Skips the model load entirely when the output is newer than the catalog,
+    and encodes only the new entries when the catalog merely grew.
+    """
+    out = Path(output_file)
+    src = Path(json_file)
+    if out.exists() and out.stat().st_mtime > src.stat().st_mtime:
+        print("Embeddings up to date, nothing to do")
+        return None, None
+
+    with open(json_file, "r", encoding="utf-8") as fh:
+        drawbacks = json.load(fh)
+
+    names = [d["name"] for d in drawbacks]
+
+    # Incremental path: if the catalog only grew, encode the delta and stack
+    # it onto the existing matrix instead of re-encoding everything.
+    old_matrix = None
+    mapping_file = out.with_name(out.stem + "_mapping.json")
+    if out.exists() and mapping_file.exists():
+        with open(mapping_file, "r", encoding="utf-8") as fh:
+            old_mapping = json.load(fh)
+        if (len(old_mapping) <= len(names)
+                and all(old_mapping.get(n) == i
+                        for i, n in enumerate(names[:len(old_mapping)]))):
+            old_matrix = np.load(out)
+            drawbacks = drawbacks[len(old_mapping):]
+            if not drawbacks:
+                print("Embeddings up to date, nothing to do")
+                return old_matrix, old_mapping
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(MODEL_NAME)
+
+    texts = [d.get("description", d["name"]) for d in drawbacks]
+    embeddings = model.encode(texts, show_progress_bar=True)
+
+    # float16 halves the file, C order keeps rows contiguous so that
+    # np.load(..., mmap_mode="r") gives zero-copy row slices.
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float16)
+    if old_matrix is not None:
+        embeddings = np.ascontiguousarray(
+            np.vstack([old_matrix, embeddings]), dtype=np.float16)
+    np.save(out, embeddings)
+    write_index(out.with_suffix(".idx"), names)
+
+    mapping = {name: i for i, name in enumerate(names)}
+    with open(mapping_file, "w", encoding="utf-8") as fh:
+        json.dump(mapping, fh, indent=2)
+
+    print(f"Saved {embeddings.shape[0]} embeddings "
+          f"({embeddings.shape[1]} dims, float16) to {out}")
+    return embeddings, mapping
+
+
+if __name__ == "__main__":
+    generate_drawback_embeddings()
@@ -0,0 +1,651 @@
+"""Self-contained minimal storage layer for training corpora.
+
+A deliberately small alternative to the capture-oriented schema in
+models.py: three tables, plain-record dataclasses, one file. Unlike the
+watcher database this layer also gets pointed at PostgreSQL for large
+corpora, so it keeps its own engine, metadata and table names.
+"""
+
+import csv
+import gzip
+import io
+import json
+import random
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import orjson
+
+from sqlalchemy import (JSON, Column, DateTime, ForeignKey, Index, Integer,
+                        LargeBinary, SmallInteger, String, create_engine,
+                        event, func, text)
+from sqlalchemy.dialects.postgresql import JSONB
+
+from packet_parser import pack_moves, unpack_moves
+
+# Parsed binary JSON on Postgres, plain JSON on SQLite; either way the
+# driver hands back parsed objects and no manual (de)serialization runs
+# per row.
+_JSON = JSON().with_variant(JSONB(), "postgresql")
+from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy.types import TypeDecorator
+
+DEFAULT_URL = "sqlite:///minimal_games.db"
+
+Base = declarative_base()
+
+
+class CompressedFEN(TypeDecorator):
+    """FEN text stored deflate-compressed.
+
+    ~70-byte FENs are repetitive (piece letters, slashes, digits) but
+    sit far below the thresholds where the database compresses values
+    itself, so every row paid full price. Deflate at level 3 runs at
+    the ORM boundary instead and cuts the column roughly in half.
+    Rows written before the change come back as plain text and pass
+    through untouched.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return zlib.compress(value.encode(), 3)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, str):  # legacy uncompressed row
+            return value
+        if value[:1] == b"\x78":
+            return zlib.decompress(value).decode()
+        return value.decode()
+
+
+class Game(Base):
+    """One stored game."""
+
+    __tablename__ = "minimal_games"
+
+    id = Column(Integer, primary_key=True)
+    uuid = Column(String(64), unique=True, nullable=False)
+    white_drawback = Column(String(128))
+    black_drawback = Column(String(128))
+    result = Column(String(16))
+    # Columnar snapshot of the game's positions (see _pack_positions):
+    # the whole-game read path decodes this one blob instead of a
+    # Position row per ply.
+    positions_blob = Column(LargeBinary)
+    created_at = Column(DateTime, server_default=func.now())
+
+
+class Position(Base):
+    """One ply: board plus the legal moves offered."""
+
+    __tablename__ = "minimal_positions"
+
+    id = Column(Integer, primary_key=True)
+    game_id = Column(Integer, ForeignKey("minimal_games.id"),
+                     nullable=False, index=True)
+    move_number = Column(Integer, nullable=False)
+    fen = Column(CompressedFEN, nullable=False)
+    # Packed uint16 blob (see packet_parser.pack_moves): the move
+    # vocabulary is bounded, so each UCI costs 2 bytes instead of ~7 as
+    # JSON text, and reads skip the JSON parse entirely.
+    legal_moves_blob = Column(LargeBinary)
+
+    def get_legal_moves(self):
+        if not self.legal_moves_blob:
+            return []
+        return unpack_moves(self.legal_moves_blob)
+
+    def set_legal_moves(self, moves):
+        self.legal_moves_blob = pack_moves(moves)
+
+
+class Drawback(Base):
+    """A detected drawback effect at a position."""
+
+    __tablename__ = "minimal_drawbacks"
+
+    id = Column(Integer, primary_key=True)
+    game_id = Column(Integer, ForeignKey("minimal_games.id"),
+                     nullable=False, index=True)
+    position_id = Column(Integer, ForeignKey("minimal_positions.id"),
+                         index=True)
+    drawback_type = Column(String(64))
+    # Fixed-point: severity in [0.0, 1.0] stored as an int scaled by
+    # 1000 (0.5 -> 500). Half the bytes of a float and the hot >=
+    # filters compare integers on the index.
+    severity = Column(SmallInteger, default=0)
+    legal_moves_response = Column(_JSON)
+
+    __table_args__ = (
+        # One covering index serves the severity/type scans and projects
+        # game_id/position_id without touching the heap (index-only scan
+        # on Postgres, which also gets the row id via INCLUDE). Replaces
+        # the old single-column severity and type indexes.
+        Index("idx_drawback_sev_type_game", severity, drawback_type,
+              game_id, position_id, postgresql_include=["id"]),
+        # Key filtering over the response payload on Postgres.
+        Index("idx_drawback_jsonb", legal_moves_response,
+              postgresql_using="gin"),
+    )
+
+    position = relationship("Position")
+
+    @property
+    def severity_f(self):
+        return self.severity / 1000.0
+
+    def get_legal_moves_response(self):
+        return self.legal_moves_response or {}
+
+    def set_legal_moves_response(self, response):
+        self.legal_moves_response = response
+
+
+# slots=True: no per-instance __dict__ on records created once per
+# position/drawback in get_game and every export — smaller and with
+# fixed-offset attribute access.
+@dataclass(slots=True)
+class MinimalPosition:
+    move_number: int
+    fen: str
+    legal_moves: list = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class MinimalDrawback:
+    move_number: int
+    drawback_type: str
+    severity: float = 0.0
+    legal_moves: list = field(default_factory=list)
+    metadata: dict = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class MinimalGame:
+    uuid: str
+    white_drawback: str = None
+    black_drawback: str = None
+    result: str = None
+    positions: list = field(default_factory=list)
+    drawbacks: list = field(default_factory=list)
+
+
+def _pack_positions(positions):
+    """Encode a game's positions as one compressed columnar blob.
+
+    Three parallel arrays ({"mn", "fen", "lm"}) instead of a list of
+    per-position dicts: the repeated keys disappear and the near-
+    identical FENs sit next to each other, which gzip exploits. One
+    blob per game replaces N Position-row decodes on read.
+    """
+    if not positions:
+        return None
+    cols = {
+        "mn": [pos.move_number for pos in positions],
+        "fen": [pos.fen for pos in positions],
+        "lm": [pos.legal_moves for pos in positions],
+    }
+    return gzip.compress(orjson.dumps(cols), compresslevel=1)
+
+
+def _unpack_positions(blob):
+    """Inverse of _pack_positions; None for games stored before it."""
+    if not blob:
+        return None
+    cols = orjson.loads(gzip.decompress(blob))
+    return [
+        MinimalPosition(move_number=mn, fen=fen, legal_moves=lm)
+        for mn, fen, lm in zip(cols["mn"], cols["fen"], cols["lm"])
+    ]
+
+
+class MinimalStorage:
+    """Store and retrieve MinimalGame records."""
+
+    # Dashboard statistics are served from a short-lived cache; they
+    # are polled far more often than the corpus changes.
+    STATS_TTL = 30.0
+
+    def __init__(self, url=DEFAULT_URL):
+        # The hot lookups (get_game, the training generators, the stats
+        # aggregates) re-issue the same statement shapes constantly; a
+        # larger compilation cache keeps them all resident so each call
+        # reuses the compiled SQL instead of re-rendering it.
+        engine_kwargs = {"query_cache_size": 1200}
+        if url.startswith("postgresql"):
+            # psycopg2 batch helpers: the bulk executemany batches go
+            # out as a few multi-row VALUES statements instead of one
+            # round trip per row.
+            engine_kwargs.update(
+                executemany_mode="values_plus_batch",
+                executemany_values_page_size=1000,
+                executemany_batch_page_size=500,
+            )
+        elif url.startswith("sqlite"):
+            engine_kwargs["connect_args"] = {"check_same_thread": False}
+        self.engine = create_engine(url, **engine_kwargs)
+        if self.engine.dialect.name == "sqlite":
+            # WAL + NORMAL drop the fsync-per-commit during batch
+            # ingest while keeping durability to the last checkpoint,
+            # same settings as the watcher database.
+            @event.listens_for(self.engine, "connect")
+            def _set_sqlite_pragmas(dbapi_conn, _record):
+                cursor = dbapi_conn.cursor()
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA synchronous=NORMAL")
+                cursor.close()
+        Base.metadata.create_all(self.engine)
+        # On Postgres the drawback-type histogram comes from a
+        # materialized view refreshed after each store instead of a
+        # GROUP BY over the whole table per stats call. The unique
+        # index lets REFRESH ... CONCURRENTLY run without blocking
+        # readers. SQLite has no materialized views and keeps the live
+        # query.
+        if self.engine.dialect.name == "postgresql":
+            with self.engine.begin() as conn:
+                conn.execute(text(
+                    "CREATE MATERIALIZED VIEW IF NOT EXISTS"
+                    " minimal_drawback_type_counts AS"
+                    " SELECT drawback_type, COUNT(*) AS cnt"
+                    " FROM minimal_drawbacks GROUP BY drawback_type"))
+                conn.execute(text(
+                    "CREATE UNIQUE INDEX IF NOT EXISTS"
+                    " uq_minimal_type_counts"
+                    " ON minimal_drawback_type_counts (drawback_type)"))
+        self.Session = sessionmaker(bind=self.engine)
+        self._stats_cache = None
+        self._stats_time = 0.0
+
+    @contextmanager
+    def get_session(self):
+        session = self.Session()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    # Batches below this stay on bulk_insert_mappings; COPY setup cost
+    # only pays off for real batches.
+    BULK_COPY_MIN_ROWS = 100
+
+    def _bulk_copy(self, session, table_name, rows, columns):
+        """COPY row dicts into a table on PostgreSQL.
+
+        COPY pays statement parsing, locking and type checks once per
+        batch instead of once per row, which is 4-5x faster than INSERT
+        for big ingests. Returns False when the dialect is not Postgres
+        or the batch is small, so the caller falls back to
+        bulk_insert_mappings (SQLite has no COPY).
+        """
+        if (session.bind.dialect.name != "postgresql"
+                or len(rows) < self.BULK_COPY_MIN_ROWS):
+            return False
+        buf = io.StringIO()
+        writer = csv.writer(buf, delimiter="\t", lineterminator="\n")
+        for row in rows:
+            writer.writerow([
+                r"\N" if value is None
+                else orjson.dumps(value).decode()
+                if isinstance(value, (dict, list)) else value
+                for value in (row[col] for col in columns)])
+        buf.seek(0)
+        # The writer above emits CSV conventions — the JSON payloads get
+        # quoted with embedded quotes doubled — so the server must read
+        # CSV too: copy_from consumes text format, which would take the
+        # quoting literally and reject every row. \N stays unquoted and
+        # still reads as NULL.
+        cursor = session.connection().connection.cursor()
+        cursor.copy_expert(
+            "COPY {} ({}) FROM STDIN WITH (FORMAT csv,"
+            " DELIMITER E'\\t', NULL '\\N')".format(
+                table_name, ", ".join(columns)),
+            buf)
+        return True
+
+    def store_game(self, game_data):
+        """Persist a MinimalGame and return the database game id.
+
+        Positions and drawbacks go in as two bulk executemany batches —
+        one multi-row INSERT each — instead of a session.add + flush
+        round trip per row. return_defaults on the position batch fills
+        in the generated ids the drawback rows reference.
+        """
+        with self.get_session() as session:
+            game = Game(
+                uuid=game_data.uuid,
+                white_drawback=game_data.white_drawback,
+                black_drawback=game_data.black_drawback,
+                result=game_data.result,
+                positions_blob=_pack_positions(game_data.positions),
+            )
+            session.add(game)
+            session.flush()
+            pos_rows = [
+                {"game_id": game.id,
+                 "move_number": pos.move_number,
+                 "fen": pos.fen,
+                 "legal_moves_blob": pack_moves(pos.legal_moves)}
+                for pos in game_data.positions
+            ]
+            session.bulk_insert_mappings(Position, pos_rows,
+                                         return_defaults=True)
+            position_map = {row["move_number"]: row["id"]
+                            for row in pos_rows}
+            drawback_rows = [
+                {"game_id": game.id,
+                 "position_id": position_map.get(d.move_number),
+                 "drawback_type": d.drawback_type,
+                 "severity": int(round(d.severity * 1000)),
+                 "legal_moves_response": {"legal_moves": d.legal_moves,
+                                          **d.metadata}}
+                for d in game_data.drawbacks
+            ]
+            if drawback_rows and not self._bulk_copy(
+                    session, "minimal_drawbacks", drawback_rows,
+                    ("game_id", "position_id", "drawback_type",
+                     "severity", "legal_moves_response")):
+                session.bulk_insert_mappings(Drawback, drawback_rows)
+            game_id = game.id
+        if drawback_rows:
+            self._refresh_type_counts()
+        return game_id
+
+    def _refresh_type_counts(self):
+        """Refresh the Postgres type-count view after a store commits.
+
+        CONCURRENTLY keeps readers off the lock; on SQLite (no
+        materialized views) this is a no-op and get_statistics runs the
+        live GROUP BY instead.
+        """
+        if self.engine.dialect.name != "postgresql":
+            return
+        # REFRESH ... CONCURRENTLY refuses to run inside a transaction
+        # block, so it needs an autocommit connection, not engine.begin().
+        with self.engine.connect().execution_options(
+                isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(
+                "REFRESH MATERIALIZED VIEW CONCURRENTLY"
+                " minimal_drawback_type_counts"))
+
+    def get_game(self, game_id):
+        """Load a full MinimalGame, or None if absent."""
+        with self.get_session() as session:
+            game = session.query(Game).get(game_id)
+            if game is None:
+                return None
+            drawbacks = (session.query(Drawback)
+                         .filter(Drawback.game_id == game_id)
+                         .all())
+            # Games stored with a positions blob decode it in one shot;
+            # only the drawbacks then need the Position table, and only
+            # its (id, move_number) projection — not the fen text and
+            # legal-moves JSON a full row drags along. Games from before
+            # the blob fall back to the per-row path.
+            minimal_positions = _unpack_positions(game.positions_blob)
+            if minimal_positions is not None:
+                move_numbers = dict(
+                    session.query(Position.id, Position.move_number)
+                    .filter(Position.game_id == game_id)
+                    .all()) if drawbacks else {}
+            else:
+                positions = (session.query(Position)
+                             .filter(Position.game_id == game_id)
+                             .order_by(Position.move_number)
+                             .all())
+                minimal_positions = [
+                    MinimalPosition(move_number=pos.move_number,
+                                    fen=pos.fen,
+                                    legal_moves=pos.get_legal_moves())
+                    for pos in positions
+                ]
+                move_numbers = {pos.id: pos.move_number
+                                for pos in positions}
+            # Mapping id -> move_number locally avoids lazy-loading
+            # d.position (one SELECT per drawback). The response JSON is
+            # parsed once per drawback and both fields derive from it.
+            minimal_drawbacks = []
+            for d in drawbacks:
+                # One shallow copy, then pop the moves out of it: the
+                # remainder IS the metadata, replacing the filtering
+                # comprehension that re-walked the dict comparing keys.
+                # The copy matters — the ORM hands back the tracked
+                # JSON value, and popping that in place would corrupt
+                # the column on a later flush.
+                resp = dict(d.get_legal_moves_response())
+                legal_moves = resp.pop("legal_moves", [])
+                minimal_drawbacks.append(MinimalDrawback(
+                    move_number=move_numbers.get(d.position_id),
+                    drawback_type=d.drawback_type,
+                    severity=d.severity / 1000.0,
+                    legal_moves=legal_moves,
+                    metadata=resp,
+                ))
+            return MinimalGame(
+                uuid=game.uuid,
+                white_drawback=game.white_drawback,
+                black_drawback=game.black_drawback,
+                result=game.result,
+                positions=minimal_positions,
+                drawbacks=minimal_drawbacks,
+            )
+
+    def get_training_positions(self, limit=1000, batch_size=500):
+        """Yield random (fen, legal moves, result, drawback) samples.
+
+        Keyset pagination: start at a random id and walk Position.id in
+        batches, wrapping around once, with the drawback LEFT JOINed
+        into the same statement. ORDER BY random() forced a full scan
+        plus sort of the positions table, and the old per-row Drawback
+        SELECT added a round trip per sample; this is an index range
+        walk with no extra queries.
+        """
+        with self.get_session() as session:
+            max_id = session.query(func.max(Position.id)).scalar()
+            if not max_id:
+                return
+            start_id = last_id = random.randint(0, max_id)
+            wrapped = False
+            yielded = 0
+            while yielded < limit:
+                query = (session.query(Position, Game.result,
+                                       Drawback.drawback_type)
+                         .select_from(Position)
+                         .join(Game, Position.game_id == Game.id)
+                         .outerjoin(Drawback,
+                                    Drawback.position_id == Position.id)
+                         .filter(Position.id > last_id))
+                # Filters first: LIMIT must go on last, a Query with it
+                # applied rejects further filter() calls.
+                if wrapped:
+                    query = query.filter(Position.id <= start_id)
+                rows = (query.order_by(Position.id)
+                        .limit(batch_size)
+                        .all())
+                if not rows:
+                    if wrapped or start_id == 0:
+                        return
+                    wrapped = True
+                    last_id = 0
+                    continue
+                for position, result, drawback_type in rows:
+                    yield {
+                        "fen": position.fen,
+                        "legal_moves": position.get_legal_moves(),
+                        "result": result,
+                        "drawback_type": drawback_type,
+                    }
+                    yielded += 1
+                    if yielded == limit:
+                        return
+                last_id = rows[-1][0].id
+
+    def get_drawback_training_data(self, min_severity=0.5):
+        """Yield samples of positions where a drawback altered the moves.
+
+        A generator over a server-streamed query: yield_per pulls rows
+        from the driver in chunks of 1000 instead of buffering the whole
+        result set behind .all(), so memory stays O(chunk) and the first
+        sample arrives before the last row is read.
+        """
+        with self.get_session() as session:
+            query = (session.query(Drawback, Position.fen,
+                                   Position.legal_moves_blob)
+                     .join(Position, Drawback.position_id == Position.id)
+                     .filter(Drawback.severity >= int(min_severity * 1000))
+                     .execution_options(stream_results=True)
+                     .yield_per(1000))
+            for drawback, fen, moves_blob in query:
+                yield {
+                    "fen": fen,
+                    "legal_moves": unpack_moves(moves_blob)
+                    if moves_blob else [],
+                    "drawback_type": drawback.drawback_type,
+                    "severity": drawback.severity / 1000.0,
+                    "response": drawback.get_legal_moves_response(),
+                }
+
+    def find_games_with_drawbacks(self, min_severity=0.5,
+                                  drawback_type=None):
+        """Ids of games containing a sufficiently severe drawback."""
+        with self.get_session() as session:
+            query = (session.query(Drawback.game_id)
+                     .filter(Drawback.severity >= int(min_severity * 1000)))
+            if drawback_type:
+                query = query.filter(
+                    Drawback.drawback_type == drawback_type)
+            return [row[0] for row in query.distinct().all()]
+
+    def cleanup_old_games(self, keep_count=10000, chunk_size=10000):
+        """Delete all but the keep_count most recent games.
+
+        Keyset form: find the id of the newest game past the keep
+        window once, then delete from there down in bounded id chunks.
+        The autoincrement id orders games by insertion, so the cutoff
+        is exact — second-granularity created_at timestamps tie across
+        a burst of stores and cannot separate the Nth game from the
+        N+1th. The old NOT IN (ten-thousand-id list) made the database
+        parse a huge literal and sequence-scan every table per delete,
+        inside one long lock-holding transaction.
+        """
+        with self.get_session() as session:
+            cutoff_id = (session.query(Game.id)
+                         .order_by(Game.id.desc())
+                         .offset(keep_count)
+                         .limit(1)
+                         .scalar())
+        if cutoff_id is None:
+            return 0
+        deleted = 0
+        while True:
+            # One chunk per transaction keeps locks short.
+            with self.get_session() as session:
+                ids = [row[0] for row in
+                       (session.query(Game.id)
+                        .filter(Game.id <= cutoff_id)
+                        .order_by(Game.id)
+                        .limit(chunk_size)
+                        .all())]
+                if not ids:
+                    return deleted
+                (session.query(Drawback)
+                 .filter(Drawback.game_id.in_(ids))
+                 .delete(synchronize_session=False))
+                (session.query(Position)
+                 .filter(Position.game_id.in_(ids))
+                 .delete(synchronize_session=False))
+                deleted += (session.query(Game)
+                            .filter(Game.id.in_(ids))
+                            .delete(synchronize_session=False))
+
+    def get_statistics(self):
+        """Corpus-wide counts for the dashboard.
+
+        Four statements instead of eight: the game counts collapse into
+        one aggregate row via FILTER clauses, the drawback counts into
+        another, plus one position count and the type histogram. The
+        result is served from a 30-second cache between refreshes.
+        """
+        now = time.monotonic()
+        if (self._stats_cache is not None
+                and now - self._stats_time < self.STATS_TTL):
+            return self._stats_cache
+        with self.get_session() as session:
+            (total_games, white_wins,
+             black_wins, draws) = session.query(
+                func.count(Game.id),
+                func.count().filter(Game.result == "white_win"),
+                func.count().filter(Game.result == "black_win"),
+                func.count().filter(Game.result == "draw"),
+            ).select_from(Game).one()
+            total_drawbacks, high_severity_drawbacks = session.query(
+                func.count(Drawback.id),
+                func.count().filter(Drawback.severity >= 700),
+            ).select_from(Drawback).one()
+            total_positions = session.query(
+                func.count(Position.id)).scalar()
+            if session.bind.dialect.name == "postgresql":
+                # O(distinct types) read of the materialized view kept
+                # fresh by _refresh_type_counts.
+                drawback_types = dict(session.execute(text(
+                    "SELECT drawback_type, cnt"
+                    " FROM minimal_drawback_type_counts"
+                    " ORDER BY cnt DESC")).all())
+            else:
+                drawback_types = dict(
+                    session.query(Drawback.drawback_type,
+                                  func.count(Drawback.id))
+                    .group_by(Drawback.drawback_type)
+                    .order_by(func.count(Drawback.id).desc())
+                    .all())
+        self._stats_cache = {
+            "total_games": total_games,
+            "white_wins": white_wins,
+            "black_wins": black_wins,
+            "draws": draws,
+            "total_positions": total_positions,
+            "total_drawbacks": total_drawbacks,
+            "high_severity_drawbacks": high_severity_drawbacks,
+            "drawback_types": drawback_types,
+        }
+        self._stats_time = now
+        return self._stats_cache
+
+    def export_training_data(self, output_path="minimal_training.jsonl",
+                             min_severity=0.5):
+        """Write the drawback training set to disk, streaming.
+
+        Samples are streamed from get_drawback_training_data and written
+        one at a time, so the corpus is never held in memory. The
+        default is JSONL — one orjson line per sample, which training
+        loaders can stream-parse — matching the watcher's exporter; a
+        path ending in .json still gets the legacy array framing.
+        """
+        count = 0
+        if output_path.endswith(".jsonl"):
+            with open(output_path, "wb") as fh:
+                for sample in self.get_drawback_training_data(min_severity):
+                    fh.write(orjson.dumps(sample))
+                    fh.write(b"\n")
+                    count += 1
+            return count
+        with open(output_path, "w", encoding="utf-8") as fh:
+            fh.write("[\n")
+            for sample in self.get_drawback_training_data(min_severity):
+                if count:
+                    fh.write(",\n")
+                json.dump(sample, fh)
+                count += 1
+            fh.write("\n]\n")
+        return count
@@ -0,0 +1,185 @@
+"""SQLAlchemy models for captured Drawback Chess games."""
+
+import gzip
+
+import orjson
+
+from sqlalchemy import (Boolean, Column, DateTime, Float, ForeignKey, Index,
+                        Integer, LargeBinary, String, Text, UniqueConstraint,
+                        func)
+from sqlalchemy.orm import declarative_base, relationship
+
+from packet_parser import pack_moves, unpack_moves
+
+Base = declarative_base()
+
+
+def compress_json(obj):
+    """orjson-encode then gzip at level 1; sensor dicts shrink ~5x."""
+    return gzip.compress(orjson.dumps(obj), compresslevel=1)
+
+
+def decompress_json(blob):
+    """Inverse of compress_json; tolerates legacy uncompressed JSON."""
+    if not blob:
+        return {}
+    if isinstance(blob, bytes) and blob[:2] == b"\x1f\x8b":
+        blob = gzip.decompress(blob)
+    return orjson.loads(blob)
+
+
+class Game(Base):
+    """One game observed on drawbackchess.com."""
+
+    __tablename__ = "games"
+
+    id = Column(Integer, primary_key=True)
+    uuid = Column(String(64), unique=True, nullable=False)
+    white_drawback = Column(String(128))
+    black_drawback = Column(String(128))
+    result = Column(String(16))
+    total_moves = Column(Integer, default=0)
+    created_at = Column(DateTime, server_default=func.now())
+
+    positions = relationship("Position", back_populates="game")
+    moves = relationship("Move", back_populates="game")
+    sensor_readings = relationship("SensorReading")
+
+
+class Position(Base):
+    """A single ply of a game: the board plus the legal moves we saw."""
+
+    __tablename__ = "positions"
+    __table_args__ = (
+        # Backs the ON CONFLICT dedup on ingest.
+        UniqueConstraint("game_id", "move_number", name="uq_pos_game_ply"),
+        # Backs the latest-move-per-side lookup in _handle_local_move.
+        Index("ix_pos_game_side_ply", "game_id", "active_side", "move_number"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    game_id = Column(Integer, ForeignKey("games.id"), nullable=False)
+    move_number = Column(Integer, nullable=False)
+    fen = Column(Text, nullable=False)
+    active_side = Column(String(5))
+    move_uci = Column(String(8))
+    # Packed uint16 blob (see packet_parser.pack_moves): 2 bytes per move
+    # versus ~7 as JSON text, which dominated row size on this table.
+    legal_moves_blob = Column(LargeBinary)
+    legal_move_count = Column(Integer)
+    created_at = Column(DateTime, server_default=func.now())
+
+    game = relationship("Game", back_populates="positions")
+    legal_moves = relationship("LegalMove")
+
+    def get_legal_moves(self):
+        if not self.legal_moves_blob:
+            return []
+        # Decoded once per instance; repeat callers get the same list.
+        cached = getattr(self, "_moves_cache", None)
+        if cached is None:
+            cached = self._moves_cache = unpack_moves(self.legal_moves_blob)
+        return cached
+
+    def set_legal_moves(self, moves):
+        self._moves_cache = list(moves)
+        self.legal_moves_blob = pack_moves(moves)
+        self.legal_move_count = len(moves)
+
+
+class LegalMove(Base):
+    """One legal move offered at an archived position.
+
+    The live ingest path keeps only the packed UCIs on the Position row;
+    this table carries the per-move annotations (captures, checks) that
+    the 16-bit codes cannot.
+    """
+
+    __tablename__ = "legal_moves"
+
+    id = Column(Integer, primary_key=True)
+    position_id = Column(Integer, ForeignKey("positions.id"), nullable=False)
+    move_uci = Column(String(8), nullable=False)
+    is_capture = Column(Boolean, default=False)
+    gives_check = Column(Boolean, default=False)
+
+
+class Move(Base):
+    """A move one side actually played."""
+
+    __tablename__ = "moves"
+
+    id = Column(Integer, primary_key=True)
+    game_id = Column(Integer, ForeignKey("games.id"), nullable=False)
+    move_number = Column(Integer, nullable=False)
+    uci = Column(String(8), nullable=False)
+    san = Column(String(16))
+    side = Column(String(5))
+    created_at = Column(DateTime, server_default=func.now())
+
+    game = relationship("Game", back_populates="moves")
+
+
+class SensorReading(Base):
+    """Raw auxiliary data captured alongside a game packet."""
+
+    __tablename__ = "sensor_readings"
+    __table_args__ = (
+        # Backs find_games_with_drawbacks: equality columns lead and the
+        # severity range predicate comes last, so the filter is one index
+        # range seek instead of a table scan.
+        Index("ix_sensor_drawback", "drawback_detected", "drawback_type",
+              "drawback_severity"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    game_id = Column(Integer, ForeignKey("games.id"))
+    reading_type = Column(String(32))
+    # Gzipped orjson blobs (see compress_json): the repetitive sensor
+    # dicts dominated database size and read IO as plain JSON text.
+    raw_data = Column(LargeBinary)
+    processed_data = Column(LargeBinary)
+    drawback_detected = Column(Boolean, default=False)
+    drawback_type = Column(String(64))
+    drawback_severity = Column(Float, default=0.0)
+    created_at = Column(DateTime, server_default=func.now())
+
+    def get_raw_data(self):
+        # gunzip + parse happen once per instance, not once per call.
+        cached = getattr(self, "_raw_cache", None)
+        if cached is None:
+            cached = self._raw_cache = decompress_json(self.raw_data)
+        return cached
+
+    def get_processed_data(self):
+        cached = getattr(self, "_processed_cache", None)
+        if cached is None:
+            cached = self._processed_cache = decompress_json(
+                self.processed_data)
+        return cached
+
+
+class TrainingSample(Base):
+    """A (position, legal moves, drawback) sample for the move-legality model."""
+
+    __tablename__ = "training_samples"
+
+    id = Column(Integer, primary_key=True)
+    fen = Column(Text, nullable=False)
+    drawback = Column(String(128))
+    legal_moves_json = Column(Text)
+    illegal_moves_json = Column(Text)
+    created_at = Column(DateTime, server_default=func.now())
+
+
+class Pattern(Base):
+    """An aggregated pattern (e.g. a move repeatedly blocked by a drawback)."""
+
+    __tablename__ = "patterns"
+
+    id = Column(Integer, primary_key=True)
+    pattern_type = Column(String(32), nullable=False)
+    pattern_key = Column(String(256), unique=True, nullable=False)
+    occurrences = Column(Integer, default=1)
+    confidence = Column(Float, default=0.0)
+    last_seen = Column(DateTime, server_default=func.now())
@@ -0,0 +1,104 @@
+"""Helpers that turn drawbackchess.com packet payloads into engine-friendly data."""
+
+import struct
+from functools import lru_cache
+
+PIECE_LETTERS = {
+    "pawn": "p",
+    "knight": "n",
+    "bishop": "b",
+    "rook": "r",
+    "queen": "q",
+    "king": "k",
+}
+
+# Full square-token -> FEN letter, precomputed once so the per-square work
+# in board_to_fen is a single C-level dict lookup instead of a partition,
+# a piece lookup, and a case branch.
+_SQUARE_LETTER = {
+    f"{color}_{piece}": (letter.upper() if color == "white" else letter)
+    for color in ("white", "black")
+    for piece, letter in PIECE_LETTERS.items()
+}
+
+
+# A UCI move fits in 16 bits: from-square (6) | to-square (6) | promotion
+# piece (3, with king included for drawback variants). Stored as little-
+# endian uint16s, a move list is 2 bytes/move instead of ~7 as JSON text.
+_FILES = "abcdefgh"
+_PROMO = {"": 0, "n": 1, "b": 2, "r": 3, "q": 4, "k": 5}
+_PROMO_INV = {v: k for k, v in _PROMO.items()}
+
+
+def _square_index(file_char, rank_char):
+    return (ord(file_char) - 97) | ((ord(rank_char) - 49) << 3)
+
+
+def pack_moves(uci_list):
+    """Encode a list of UCI moves as a packed uint16 blob."""
+    codes = []
+    for uci in uci_list:
+        code = (_square_index(uci[0], uci[1])
+                | _square_index(uci[2], uci[3]) << 6
+                | _PROMO[uci[4:5]] << 12)
+        codes.append(code)
+    return struct.pack(f"<{len(codes)}H", *codes)
+
+
+def unpack_moves(blob):
+    """Decode a pack_moves blob back into UCI strings."""
+    moves = []
+    for code in struct.unpack(f"<{len(blob) // 2}H", blob):
+        start = code & 63
+        stop = (code >> 6) & 63
+        moves.append(f"{_FILES[start & 7]}{(start >> 3) + 1}"
+                     f"{_FILES[stop & 7]}{(stop >> 3) + 1}"
+                     f"{_PROMO_INV[code >> 12]}")
+    return moves
+
+
+@lru_cache(maxsize=4096)
+def _board_to_fen_cached(board_key, turn):
+    """FEN encoding proper, memoized on the hashable board key.
+
+    Resends and re-inits encode the same position many times per session;
+    the cache short-circuits all but the first.
+    """
+    lookup = _SQUARE_LETTER
+    ranks = []
+    for row in board_key:
+        empties = 0
+        rank = ""
+        for square in row:
+            if not square:
+                empties += 1
+                continue
+            if empties:
+                rank += str(empties)
+                empties = 0
+            rank += lookup.get(square, "?")
+        if empties:
+            rank += str(empties)
+        ranks.append(rank)
+    side = "w" if turn == "white" else "b"
+    return "/".join(ranks) + f" {side} - - 0 1"
+
+
+class PacketParser:
+    """Static helpers for decoding game_state packets."""
+
+    @staticmethod
+    def board_to_fen(board, turn):
+        """Convert the site's 8x8 board array into a FEN string.
+
+        ``board`` is a list of 8 ranks (top rank first); each square is
+        either None or a string like ``"white_pawn"``.
+        """
+        board_key = tuple(tuple(row) for row in board)
+        return _board_to_fen_cached(board_key, turn)
+
+    @staticmethod
+    def extract_legal_moves(data):
+        """Pull the UCI legal-move list out of a packet, if present."""
+        moves = data.get("legal_moves") or data.get("moves") or []
+        return [m for m in moves if isinstance(m, str)]
@@ -0,0 +1,363 @@
+"""Self-play driver: plays both colors on drawbackchess.com and logs samples.
+
+The controller opens a browser per color, sniffs the site's own traffic to
+learn the session endpoints, asks Stockfish for the physically possible
+moves each turn, and appends one training sample per observed position.
+"""
+
+import asyncio
+import atexit
+import random
+import re
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+import chess
+from playwright.async_api import Error as PlaywrightError
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from playwright.async_api import async_playwright
+
+from packet_parser import PacketParser
+
+try:
+    import orjson
+    _dumps = orjson.dumps
+except ImportError:
+    import json
+    _dumps = lambda obj: json.dumps(obj).encode()
+
+TRAINING_FILE = Path("training_data.jsonl")
+
+CASTLING_UCIS = {"e1g1", "e1c1", "e8g8", "e8c8"}
+
+# Compiled once; handle_request runs on every HTTP request the pages emit.
+_RE_USER = re.compile(r"username=([^&]+)")
+_RE_APP = re.compile(r"drawbackchess\.com/(app\d+)/game")
+_RE_ID = re.compile(r"id=([a-f0-9]+)")
+
+# Request headers never change across a game.
+_BASE_HEADERS = {
+    "content-type": "application/json",
+    "accept": "*/*",
+    "origin": "https://www.drawbackchess.com",
+}
+
+# Squares the king passed through while castling; in Drawback Chess a king
+# that castled through attack can be captured "en passant" on these squares.
+# Keyed by castle UCI, values as destination-square strings so candidate
+# moves can be tested with a plain `move[2:4] in ghost` set lookup.
+GHOST_UCI = {
+    "e1g1": frozenset({"f1", "e1"}),
+    "e1c1": frozenset({"d1", "e1"}),
+    "e8g8": frozenset({"f8", "e8"}),
+    "e8c8": frozenset({"d8", "e8"}),
+}
+
+
+class StockfishWrapper:
+    """Thin blocking UCI wrapper; only move generation is used."""
+
+    def __init__(self, path="stockfish"):
+        self.process = subprocess.Popen(
+            [path], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            text=True, bufsize=1)
+        self._send("uci")
+        self._wait_for("uciok")
+
+    def _send(self, command):
+        self.process.stdin.write(command + "\n")
+
+    def _wait_for(self, token):
+        for line in self.process.stdout:
+            if line.startswith(token):
+                return
+
+    def get_physical_moves(self, fen):
+        """All physically possible moves in the position (perft 1 move list)."""
+        self._send(f"position fen {fen}")
+        self._send("go perft 1")
+        moves = []
+        for line in self.process.stdout:
+            line = line.strip()
+            if line.startswith("Nodes searched"):
+                break
+            if ":" in line:
+                moves.append(line.split(":", 1)[0])
+        return moves
+
+    def quit(self):
+        self._send("quit")
+        self.process.wait(timeout=5)
+
+
+class SelfPlayController:
+
+    def __init__(self):
+        self.engine = StockfishWrapper()
+        self.training_file = TRAINING_FILE
+        # One handle for the controller's lifetime: open-per-sample cost two
+        # syscalls per move and defeated OS write coalescing.
+        self._train_fp = self.training_file.open("ab", buffering=1 << 16)
+        self._samples_since_flush = 0
+        atexit.register(self._close_training_file)
+        # Samples are queued here and written from an executor thread so the
+        # encode + disk write never stalls the Playwright callbacks.
+        self._writer_queue = asyncio.Queue()
+        self._writer_task = None
+        # Signalled by handle_response whenever a new position lands, so the
+        # game loop sleeps instead of polling.
+        self._turn_ready = asyncio.Event()
+        # FEN hashes already written, LRU-bounded; self-play revisits the
+        # same openings and forced lines constantly and identical positions
+        # produce identical samples.
+        self._seen_fens = OrderedDict()
+        # Engine move generation is an IPC round trip; cache it keyed by the
+        # FEN minus the move counters (irrelevant to move generation) so
+        # decide_move and run_learning_step share hits.
+        self._physical_moves_cached = lru_cache(maxsize=4096)(
+            self._physical_moves_uncached)
+        # Move URL and payload dict are reused across moves; only the
+        # fields that change per move are overwritten.
+        self._move_url_by_side = {}
+        self._move_payload = {"start": None, "stop": None, "promotion": None}
+        # The engine's UCI round trip is blocking; a single-worker executor
+        # keeps it off the event loop (and serializes access to the one
+        # Stockfish process) so response handling overlaps engine compute.
+        self._engine_pool = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="engine")
+        self.session_data = {}
+        self.pages = {}
+        self.latest_fen = {}
+        self.last_move_uci = {}
+
+    @staticmethod
+    def _other(side):
+        return "black" if side == "white" else "white"
+
+    def _physical_moves_uncached(self, fen_key):
+        return self.engine.get_physical_moves(fen_key + " 0 1")
+
+    def _physical_moves(self, fen):
+        return self._physical_moves_cached(fen.rsplit(" ", 2)[0])
+
+    async def _physical_moves_async(self, fen):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._engine_pool, self._physical_moves, fen)
+
+    def _prefetch_after(self, fen, move):
+        """Warm the move cache for the position our own move just created.
+
+        The bot plays both colors, so the FEN after our move is fully
+        determined; querying the engine while the move packet is in flight
+        hides the engine round trip behind the network one.
+        """
+        try:
+            board = chess.Board(fen)
+            board.push_uci(move)
+        except ValueError:
+            return
+        self._physical_moves(board.fen())
+
+    # --- traffic handlers ---
+
+    async def handle_request(self, request, side):
+        try:
+            url = request.url
+            entry = self.session_data.setdefault(side, {})
+            # Cheap C-level substring checks gate the regex engine.
+            if "username=" in url:
+                match = _RE_USER.search(url)
+                if match:
+                    entry["username"] = match.group(1)
+            if "/game" in url:
+                app_match = _RE_APP.search(url)
+                if app_match:
+                    entry["prefix"] = app_match.group(1)
+            if "id=" in url:
+                id_match = _RE_ID.search(url)
+                if id_match:
+                    entry["game_id"] = id_match.group(1)
+        except (KeyError, AttributeError, PlaywrightError):
+            pass
+
+    async def handle_response(self, response, side):
+        try:
+            if "game" not in response.url and "poll" not in response.url:
+                return
+            # Filter before materializing: only JSON API responses are worth
+            # marshalling across the CDP bridge ("game" also matches asset
+            # URLs like game.css).
+            if response.request.resource_type not in ("xhr", "fetch"):
+                return
+            if not response.headers.get("content-type", "").startswith(
+                    "application/json"):
+                return
+            # response.json() decodes in the driver; no full str body is
+            # materialized and no second parse happens here. The fast reject
+            # is two hash lookups instead of two full-body substring scans.
+            data = await response.json()
+            if "moves" in data and "handicaps" in data:
+                fen = PacketParser.board_to_fen(data["board"], data["turn"])
+                self.latest_fen[side] = fen
+                if data.get("last_move"):
+                    self.last_move_uci[self._other(side)] = data["last_move"]
+                await self.run_learning_step(fen, side, data)
+                self._turn_ready.set()
+        except (ValueError, KeyError, AttributeError, PlaywrightError):
+            # ValueError covers JSON decode failures; PlaywrightError covers
+            # bodies that vanished with their context. Anything else should
+            # surface, including KeyboardInterrupt.
+            pass
+
+    _SEEN_FENS_CAP = 200_000
+
+    async def run_learning_step(self, fen, side, data):
+        """Append one (position, server legal moves, engine moves) sample."""
+        key = hash(fen)
+        if key in self._seen_fens:
+            self._seen_fens.move_to_end(key)
+            return
+        self._seen_fens[key] = None
+        if len(self._seen_fens) > self._SEEN_FENS_CAP:
+            self._seen_fens.popitem(last=False)
+
+        physical = await self._physical_moves_async(fen)
+        sample = {
+            "fen": fen,
+            "side": side,
+            "server_moves": data.get("moves", []),
+            "physical_moves": physical,
+            "drawback": data.get("handicaps", {}).get(side),
+        }
+        self._writer_queue.put_nowait(sample)
+
+    async def _drain_writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            sample = await self._writer_queue.get()
+            await loop.run_in_executor(None, self._write_sample, sample)
+
+    def _write_sample(self, sample):
+        self._train_fp.write(_dumps(sample) + b"\n")
+        self._samples_since_flush += 1
+        if self._samples_since_flush >= 32:
+            self._train_fp.flush()
+            self._samples_since_flush = 0
+
+    def _close_training_file(self):
+        if not self._train_fp.closed:
+            self._train_fp.close()
+
+    # --- move selection ---
+
+    async def decide_move(self, side):
+        fen = self.latest_fen.get(side)
+        if not fen:
+            return None
+        potential_moves = await self._physical_moves_async(fen)
+        if not potential_moves:
+            return None
+        last = self.last_move_uci.get(self._other(side))
+        is_king_capture_possible = last in CASTLING_UCIS
+        if is_king_capture_possible:
+            # The side to move is one character of the FEN; no need to parse
+            # the whole position into a Board just to read it.
+            opponent_is_white = fen.split(" ", 2)[1] == "b"
+            if (last[1] == "1") == opponent_is_white:
+                ghost = GHOST_UCI[last]
+                # Only this rare branch needs deduplication.
+                candidates = set(potential_moves)
+                winning = [m for m in candidates if m[2:4] in ghost]
+                if winning:
+                    return random.choice(winning)
+                return random.choice(list(candidates))
+
+        return random.choice(potential_moves)
+
+    async def execute_move(self, side, move):
+        target_url = self._move_url_by_side.get(side)
+        if target_url is None:
+            session = self.session_data.get(side, {})
+            prefix = session.get("prefix")
+            game_id = session.get("game_id")
+            if not prefix or not game_id:
+                return
+            target_url = (f"https://www.drawbackchess.com/{prefix}/move"
+                          f"?id={game_id}")
+            self._move_url_by_side[side] = target_url
+        payload = self._move_payload
+        payload["start"] = move[:2]
+        payload["stop"] = move[2:4]
+        payload["promotion"] = move[4:] or None
+        await self.pages[side].request.post(
+            target_url, data=payload, headers=_BASE_HEADERS)
+        self.last_move_uci[side] = move
+        self.latest_fen.pop(side, None)
+
+    # --- lifecycle ---
+
+    async def handle_initial_popups(self, page):
+        try:
+            await page.click("text=Accept", timeout=3000)
+        except PlaywrightTimeoutError:
+            pass
+        try:
+            await page.click("text=Play", timeout=3000)
+        except PlaywrightTimeoutError:
+            pass
+
+    async def start(self):
+        self._writer_task = asyncio.create_task(self._drain_writer())
+        async with async_playwright() as p:
+            # One Chromium process; a context per color gives each side its
+            # own cookie jar without a second browser launch.
+            browser = await p.chromium.launch(headless=False)
+            for side in ("white", "black"):
+                context = await browser.new_context()
+                page = await context.new_page()
+                self.pages[side] = page
+                # Cheap URL checks in the sync listener: no Task is
+                # allocated or scheduled for the ~95% of traffic (assets,
+                # telemetry) the handlers would ignore anyway.
+                page.on(
+                    "request",
+                    lambda r, s=side: (
+                        "username=" in r.url or "/game" in r.url
+                        or "id=" in r.url)
+                    and asyncio.create_task(self.handle_request(r, s)))
+                page.on(
+                    "response",
+                    lambda r, s=side: (
+                        "game" in r.url or "poll" in r.url)
+                    and asyncio.create_task(self.handle_response(r, s)))
+                await page.goto("https://www.drawbackchess.com")
+                await self.handle_initial_popups(page)
+
+            try:
+                while True:
+                    await self._turn_ready.wait()
+                    self._turn_ready.clear()
+                    for side in ("white", "black"):
+                        if side in self.latest_fen:
+                            fen = self.latest_fen[side]
+                            move = await self.decide_move(side)
+                            if move:
+                                await self.execute_move(side, move)
+                                self._engine_pool.submit(
+                                    self._prefetch_after, fen, move)
+            finally:
+                self._writer_task.cancel()
+                self._engine_pool.shutdown(wait=False)
+                self.engine.quit()
+                await browser.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(SelfPlayController().start())
+    except KeyboardInterrupt:
+        pass
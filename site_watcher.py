@@ -0,0 +1,179 @@
+"""Watch drawbackchess.com traffic and feed decoded packets to the database."""
+
+import asyncio
+import json
+import time
+
+import orjson
+
+from playwright.async_api import async_playwright
+
+from data_handler import DataHandler
+
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:  # not available on Windows
+    pass
+
+LOG_FILE = "watcher_log.txt"
+
+# Wall-clock seconds at local midnight, fixed at import; _timestamp then
+# formats HH:MM:SS.mmm with integer arithmetic instead of a strftime call
+# per packet.
+_lt = time.localtime()
+_MIDNIGHT = time.time() - (_lt.tm_hour * 3600 + _lt.tm_min * 60 + _lt.tm_sec)
+
+
+def _timestamp():
+    ms = int((time.time() - _MIDNIGHT) * 1000)
+    return (f"{ms // 3600000 % 24:02d}:{ms // 60000 % 60:02d}:"
+            f"{ms // 1000 % 60:02d}.{ms % 1000:03d}")
+
+
+class DrawbackWatcher:
+
+    FLUSH_BYTES = 65536
+    FLUSH_AGE = 0.1  # seconds
+
+    def __init__(self):
+        self.log_file = LOG_FILE
+        self.data_handler = DataHandler()
+        # Important frames are persisted through a byte buffer flushed on
+        # size or age; no syscall per packet.
+        self._log_fh = open(self.log_file, "ab")
+        self._buf = bytearray()
+        self._last_flush = time.monotonic()
+
+    # Classification patterns, compiled once per class; bytes frames are
+    # matched without a decode.
+    _PATTERNS_B = (b"reveal", b'"type":"init"', b'"type":"game',
+                   b'"type":"local_move"')
+    _PATTERNS_S = ("reveal", '"type":"init"', '"type":"game',
+                   '"type":"local_move"')
+
+    def log_packet(self, direction, payload):
+        # Classify on the raw payload first; JSON is only materialized for
+        # the frames we actually act on. One lowered copy serves all
+        # checks, and each pattern is scanned exactly once.
+        lp = payload.lower()
+        pats = self._PATTERNS_S if isinstance(lp, str) else self._PATTERNS_B
+        if (lp.find(pats[0]) < 0 and lp.find(pats[1]) < 0
+                and lp.find(pats[2]) < 0 and lp.find(pats[3]) < 0):
+            return
+
+        timestamp = _timestamp()
+        try:
+            data = orjson.loads(payload)
+            pretty_payload = orjson.dumps(
+                data, option=orjson.OPT_INDENT_2).decode()
+        except ValueError:
+            # stdlib as fallback: orjson rejects some edge cases (e.g.
+            # surrogates) that frames occasionally contain.
+            try:
+                data = json.loads(payload)
+                pretty_payload = json.dumps(data, indent=2)
+            except ValueError:
+                data = None
+                pretty_payload = (payload if isinstance(payload, str)
+                                  else payload.decode("utf-8", "replace"))
+
+        print(f"[{timestamp}] {direction}\n{pretty_payload}")
+        self._append_log(f"[{timestamp}] {direction}\n{pretty_payload}\n\n")
+
+        if isinstance(data, dict):
+            self.data_handler.handle_packet(data)
+
+    def _append_log(self, record):
+        self._buf.extend(record.encode("utf-8", "surrogatepass"))
+        if (len(self._buf) >= self.FLUSH_BYTES
+                or time.monotonic() - self._last_flush > self.FLUSH_AGE):
+            self._drain_log()
+
+    def _drain_log(self):
+        if self._buf:
+            self._log_fh.write(self._buf)
+            self._buf.clear()
+        self._last_flush = time.monotonic()
+
+    async def _flusher(self):
+        while True:
+            await asyncio.sleep(self.FLUSH_AGE)
+            if self._buf:
+                self._drain_log()
+
+    def _on_frame_received(self, params):
+        self._frame_q.put_nowait(("<-", params["response"]["payloadData"]))
+
+    def _on_frame_sent(self, params):
+        self._frame_q.put_nowait(("->", params["response"]["payloadData"]))
+
+    async def _consume_frames(self):
+        """Single hot loop draining the CDP frame queue into log_packet."""
+        q = self._frame_q
+        while True:
+            direction, payload = await q.get()
+            try:
+                self.log_packet(direction, payload)
+            except Exception as exc:
+                # One bad frame (missing keys, a transient database
+                # error) must not kill the only consumer task; the
+                # per-frame callbacks this loop replaced isolated such
+                # failures to the frame that caused them.
+                print(f"[watcher] frame dropped: {exc!r}")
+
+    async def watch(self):
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(
+                headless=False,
+                args=["--disable-gpu", "--disable-extensions"])
+            context = await browser.new_context()
+            # Only document/XHR/WebSocket traffic matters to the watcher;
+            # dropping images, fonts, media and CSS keeps renderer CPU away
+            # from the frame-parsing hot path.
+            async def block_assets(route):
+                if route.request.resource_type in {"image", "font", "media",
+                                                   "stylesheet"}:
+                    await route.abort()
+                else:
+                    await route.continue_()
+
+            await context.route("**/*", block_assets)
+            page = await context.new_page()
+            # One CDP session delivers every WebSocket frame; frames queue
+            # up and are drained by a single consumer task instead of one
+            # Python callback trampoline per frame.
+            self._frame_q = asyncio.Queue()
+            cdp = await context.new_cdp_session(page)
+            await cdp.send("Network.enable")
+            cdp.on("Network.webSocketFrameReceived", self._on_frame_received)
+            cdp.on("Network.webSocketFrameSent", self._on_frame_sent)
+            consumer = asyncio.create_task(self._consume_frames())
+            await page.goto("https://www.drawbackchess.com")
+            print("Watching. Ctrl-C to quit.")
+            flusher = asyncio.create_task(self._flusher())
+            try:
+                # Purely event-driven from here: WebSocket callbacks do the
+                # work, so park on a bare Future like sniff_network does
+                # instead of waking every second.
+                await asyncio.Future()
+            finally:
+                flusher.cancel()
+                consumer.cancel()
+                self._drain_log()
+                self._log_fh.close()
+
+
+def main():
+    watcher = DrawbackWatcher()
+    try:
+        asyncio.run(watcher.watch())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Drain buffered positions and commit the write session.
+        watcher.data_handler.finalize()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Low-level sniffer: append every drawbackchess.com request to a text file.
+
+Useful for reverse-engineering new endpoints; the watcher proper lives in
+site_watcher.py.
+"""
+
+import asyncio
+import json
+import time
+from datetime import datetime
+
+import orjson
+from playwright.async_api import async_playwright
+
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:  # not available on Windows
+    pass
+
+OUTPUT_FILE = "sniffed_requests.txt"
+
+FLUSH_BYTES = 65536
+FLUSH_AGE = 0.1  # seconds
+
+
+async def stick_sniff():
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=False)
+        page = await browser.new_page()
+        f = open(OUTPUT_FILE, "ab")
+        # Group-commit the writes: records accumulate in a byte buffer and
+        # hit the file on size or age, not one write+flush per request.
+        buf = bytearray()
+        last_flush = time.monotonic()
+
+        def drain():
+            nonlocal last_flush
+            if buf:
+                f.write(buf)
+                buf.clear()
+            last_flush = time.monotonic()
+
+        def log_request(request):
+            if "drawbackchess" not in request.url:
+                return
+            timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
+            line = f"[{timestamp}] {request.method} {request.url}"
+            if request.post_data:
+                try:
+                    line += " " + orjson.dumps(
+                        orjson.loads(request.post_data)).decode()
+                except ValueError:
+                    try:
+                        line += " " + json.dumps(json.loads(request.post_data))
+                    except ValueError:
+                        line += " " + request.post_data
+            buf.extend(line.encode())
+            buf.append(0x0A)
+            if (len(buf) >= FLUSH_BYTES
+                    or time.monotonic() - last_flush > FLUSH_AGE):
+                drain()
+
+        async def flusher():
+            while True:
+                await asyncio.sleep(FLUSH_AGE)
+                if buf:
+                    drain()
+
+        page.on("request", log_request)
+        await page.goto("https://www.drawbackchess.com")
+        print(f"Sniffing to {OUTPUT_FILE}. Ctrl-C to quit.")
+        flusher_task = asyncio.create_task(flusher())
+        try:
+            await asyncio.Future()
+        finally:
+            flusher_task.cancel()
+            drain()
+            f.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(stick_sniff())
+    except KeyboardInterrupt:
+        pass